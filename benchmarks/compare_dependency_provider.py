@@ -0,0 +1,266 @@
+"""Compare the same HTTP service built with nameko DependencyProviders and injector.
+
+Run with ``python benchmarks/compare_dependency_provider.py``. Both forms of the
+service are started in this process one after another and loaded over loopback by
+green threads. For each mix of endpoints the script reports throughput, latency
+percentiles and peak of memory allocated while serving the requests.
+
+Native DependencyProvider creates its dependency for each call of any entrypoint of
+the service, the decorated service creates only the dependencies the entrypoint uses.
+"""
+import eventlet
+
+eventlet.monkey_patch()  # noqa (code before rest of imports)
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import random  # noqa: E402
+import socket  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+import typing as t  # noqa: E402
+from http.client import HTTPConnection  # noqa: E402
+
+import injector as inj  # noqa: E402
+from nameko.containers import ServiceContainer  # noqa: E402
+from nameko.extensions import DependencyProvider  # noqa: E402
+from nameko.runners import ServiceRunner  # noqa: E402
+from nameko.web.handlers import http  # noqa: E402
+
+from nameko_injector.core import NamekoInjector, resource_request_scope  # noqa: E402
+
+# Share of requests to each endpoint.
+MIXES = {
+    "health-only": {"/health": 1.0},
+    "mostly-light": {"/health": 0.6, "/user": 0.3, "/report": 0.1},
+    "mostly-heavy": {"/health": 0.1, "/user": 0.3, "/report": 0.6},
+}
+# Seconds dependencies wait for I/O when created, set from the command line.
+IO_DELAY = {"value": 0.001}
+
+
+class Config(dict):
+    pass
+
+
+class DBSession:
+    """Session opens a connection and keeps a buffer per request."""
+
+    def __init__(self):
+        eventlet.sleep(IO_DELAY["value"])
+        self.buffer = bytearray(64 * 1024)
+
+    def query(self) -> int:
+        return len(self.buffer)
+
+    def close(self):
+        self.buffer = bytearray()
+
+
+class CacheClient:
+    def __init__(self):
+        eventlet.sleep(IO_DELAY["value"])
+        self.buffer = bytearray(16 * 1024)
+
+    def get(self) -> int:
+        return len(self.buffer)
+
+
+# ======================== Service with nameko DependencyProviders
+class ConfigProvider(DependencyProvider):
+    def setup(self):
+        # built once like the singleton of the injected service
+        self.config = Config(self.container.config)
+
+    def get_dependency(self, worker_ctx):
+        return self.config
+
+
+class DBSessionProvider(DependencyProvider):
+    def setup(self):
+        self.sessions = {}
+
+    def get_dependency(self, worker_ctx):
+        self.sessions[worker_ctx] = DBSession()
+        return self.sessions[worker_ctx]
+
+    def worker_teardown(self, worker_ctx):
+        self.sessions.pop(worker_ctx).close()
+
+
+class CacheClientProvider(DependencyProvider):
+    def get_dependency(self, worker_ctx):
+        return CacheClient()
+
+
+class NativeService:
+    name = "native"
+
+    config = ConfigProvider()
+    session = DBSessionProvider()
+    cache = CacheClientProvider()
+
+    @http("GET", "/health")
+    def health(self, request):
+        return "ok"
+
+    @http("GET", "/user")
+    def user(self, request):
+        return str(self.session.query())
+
+    @http("GET", "/report")
+    def report(self, request):
+        return str(self.session.query() + self.cache.get() + len(self.config))
+
+
+# ======================== Service decorated with NamekoInjector
+@inj.provider
+def provide_config(container: ServiceContainer) -> Config:
+    return Config(container.config)
+
+
+def configure(binder):
+    binder.bind(Config, to=provide_config, scope=inj.singleton)
+    binder.bind(DBSession, to=DBSession, scope=resource_request_scope)
+    binder.bind(CacheClient, to=CacheClient)
+
+
+INJECTOR = NamekoInjector(configure)
+
+
+@INJECTOR.decorate_service
+class InjectedService:
+    name = "injected"
+
+    @http("GET", "/health")
+    def health(self, request):
+        return "ok"
+
+    @http("GET", "/user")
+    def user(self, request, session: DBSession):
+        return str(session.query())
+
+    @http("GET", "/report")
+    def report(
+        self, request, session: DBSession, cache: CacheClient, config: Config
+    ):
+        return str(session.query() + cache.get() + len(config))
+
+
+# ======================== Load generation
+class Result(t.NamedTuple):
+    service: str
+    mix: str
+    requests: int
+    errors: int
+    throughput: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    peak_memory_kib: float
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(ordered: t.List[float], share: float) -> float:
+    index = min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))
+    return ordered[index] * 1000
+
+
+def _client(port: int, paths: t.Iterator[str], latencies: t.List[float]) -> int:
+    errors = 0
+    connection = HTTPConnection("127.0.0.1", port)
+    for path in paths:
+        started = time.perf_counter()
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        errors += response.status != 200
+    connection.close()
+    return errors
+
+
+def _load(port: int, sequence: t.List[str], concurrency: int):
+    latencies: t.List[float] = []
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(concurrency)
+    clients = [
+        pool.spawn(_client, port, iter(sequence[i::concurrency]), latencies)
+        for i in range(concurrency)
+    ]
+    errors = sum(client.wait() for client in clients)
+    return latencies, errors, time.perf_counter() - started
+
+
+def run(service_cls, mix: str, args) -> Result:
+    port = _free_port()
+    runner = ServiceRunner({"WEB_SERVER_ADDRESS": f"127.0.0.1:{port}"})
+    runner.add_service(service_cls)
+    runner.start()
+    try:
+        paths, weights = zip(*MIXES[mix].items())
+        # The same sequence of requests for every form of the service.
+        choice = random.Random(args.seed).choices
+        sequence = choice(paths, weights, k=args.requests)
+        # warm up the singletons and connections
+        _load(port, sequence[: args.concurrency], args.concurrency)
+
+        latencies, errors, elapsed = _load(port, sequence, args.concurrency)
+        # Tracing allocations slows the service down, memory is measured separately.
+        tracemalloc.start()
+        _load(port, sequence, args.concurrency)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        runner.stop()
+
+    ordered = sorted(latencies)
+    return Result(
+        service=service_cls.name,
+        mix=mix,
+        requests=len(latencies),
+        errors=errors,
+        throughput=len(latencies) / elapsed,
+        p50_ms=_percentile(ordered, 0.5),
+        p90_ms=_percentile(ordered, 0.9),
+        p99_ms=_percentile(ordered, 0.99),
+        peak_memory_kib=peak / 1024,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--io-delay", type=float, default=IO_DELAY["value"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", choices=sorted(MIXES), action="append")
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+    IO_DELAY["value"] = args.io_delay
+
+    if not args.json:
+        print(
+            f"{'mix':<14}{'service':<10}{'req/sec':>10}{'p50 ms':>9}{'p90 ms':>9}"
+            f"{'p99 ms':>9}{'peak KiB':>10}{'errors':>8}"
+        )
+    for mix in args.mix or sorted(MIXES):
+        for service_cls in (NativeService, InjectedService):
+            result = run(service_cls, mix, args)
+            if args.json:
+                print(json.dumps(result._asdict()))
+            else:
+                print(
+                    f"{result.mix:<14}{result.service:<10}{result.throughput:>10.0f}"
+                    f"{result.p50_ms:>9.2f}{result.p90_ms:>9.2f}{result.p99_ms:>9.2f}"
+                    f"{result.peak_memory_kib:>10.0f}{result.errors:>8}"
+                )
+
+
+if __name__ == "__main__":
+    main()
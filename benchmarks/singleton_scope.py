@@ -0,0 +1,88 @@
+"""Compare access to built singletons from many green threads.
+
+Run with ``python benchmarks/singleton_scope.py``. The process is monkey patched like
+a nameko service so injector's lock is a green one. Each green thread also creates a
+session which provider waits for I/O, like request-scoped dependencies do.
+
+Both scopes are measured on NamekoInjector, so the difference comes from the scope
+only and not from the lock NamekoInjector.get doesn't take.
+"""
+import eventlet
+
+eventlet.monkey_patch()  # noqa (code before rest of imports)
+
+import argparse  # noqa: E402
+import time  # noqa: E402
+
+import injector as inj  # noqa: E402
+from nameko.containers import ServiceContainer  # noqa: E402
+
+from nameko_injector.core import NamekoInjector  # noqa: E402
+
+
+class Config:
+    pass
+
+
+class Engine:
+    @inj.inject
+    def __init__(self, config: Config):
+        self.config = config
+
+
+class Session:
+    @inj.inject
+    def __init__(self, engine: Engine):
+        # a round trip to the database
+        eventlet.sleep()
+        self.engine = engine
+
+
+def configure(binder):
+    binder.bind(Config, scope=inj.singleton)
+    binder.bind(Engine, scope=inj.singleton)
+    binder.bind(ServiceContainer, to=object(), scope=inj.singleton)
+
+
+def stock_singleton_scope() -> NamekoInjector:
+    injector = NamekoInjector(configure)
+    injector.binder.bind(inj.SingletonScope, to=inj.SingletonScope(injector))
+    return injector
+
+
+def access(injector: inj.Injector, iterations: int) -> None:
+    for _ in range(iterations):
+        injector.get(ServiceContainer)
+        injector.get(Config)
+        injector.get(Session)
+
+
+def measure(injector: inj.Injector, threads: int, iterations: int) -> float:
+    # build the singletons before the measurement
+    access(injector, 1)
+    pool = eventlet.GreenPool(threads)
+    started = time.perf_counter()
+    for _ in range(threads):
+        pool.spawn(access, injector, iterations)
+    pool.waitall()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    # gets made by access() in each iteration
+    total = args.threads * args.iterations * 3
+    for name, injector in [
+        ("injector.SingletonScope", stock_singleton_scope()),
+        ("LockFreeSingletonScope", NamekoInjector(configure)),
+    ]:
+        elapsed = measure(injector, args.threads, args.iterations)
+        print(f"{name:<25} {elapsed:8.3f} sec {total / elapsed:12.0f} gets/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
+import contextlib
 import functools
+import inspect
 import logging
+import time
 import typing as t
 
+import eventlet
 import injector as inj
-from eventlet import corolocal, greenthread
+from eventlet import corolocal, event, greenthread, semaphore
 from nameko.containers import ServiceContainer, WorkerContext
 from nameko.extensions import DependencyProvider
-from werkzeug.wrappers import Request
+from werkzeug.wrappers import Request, Response
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -15,6 +19,36 @@ class BaseError(Exception):
     """Base error type for this library."""
 
 
+class _Pending(event.Event):
+    """Marker of an instance the owner green thread is creating right now."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.owner = greenthread.getcurrent()
+
+
+# Green threads of the requests waiting for instances created by other threads.
+_WAITING: t.Dict[t.Any, _Pending] = {}
+
+
+def _wait_for(pending: _Pending, key: str) -> inj.Provider:
+    current = greenthread.getcurrent()
+    # Waiting for an instance that can be created only after the current thread
+    # returns would block forever.
+    blocker: t.Optional[_Pending] = pending
+    while blocker is not None and not blocker.ready():
+        if blocker.owner is current:
+            raise inj.CircularDependency(
+                f"found circular dependency on {key} in the request scope"
+            )
+        blocker = _WAITING.get(blocker.owner)
+    _WAITING[current] = pending
+    try:
+        return pending.wait()
+    finally:
+        del _WAITING[current]
+
+
 class RequestScope(inj.Scope):
     """A scope defines lifetime bound to a service request."""
 
@@ -41,14 +75,103 @@ class RequestScope(inj.Scope):
         # protected and shouldn't be used outside of the library
         setattr(self._locals, repr(interface), provider)
 
+    def _get_state(self) -> t.Dict[str, t.Any]:
+        """Return storage of the current thread to be shared with other threads."""
+        return vars(self._locals)
+
+    def _adopt_state(self, state: t.Dict[str, t.Any]) -> None:
+        """Make current thread use the storage of another thread in this scope."""
+        self._locals._local__greens[greenthread.getcurrent()] = state
+
+    def iter_instances(self) -> t.Iterator[t.Any]:
+        """Iterate instances created in the scope of the current request."""
+        # Green threads sharing the state may add instances while iterating.
+        for provider in list(vars(self._locals).values()):
+            if isinstance(provider, inj.InstanceProvider):
+                yield provider.get(self.injector)
+
     def get(self, interface: t.Any, provider: inj.Provider) -> inj.Provider:
         key = repr(interface)
         try:
-            return getattr(self._locals, key)
+            found = getattr(self._locals, key)
         except AttributeError:
-            provider = inj.InstanceProvider(provider.get(self.injector))
-            setattr(self._locals, key, provider)
-            return provider
+            return self._create(key, provider)
+        if isinstance(found, _Pending):
+            # Another thread sharing the state is creating the instance right now.
+            return _wait_for(found, key)
+        return found
+
+    def _create(self, key: str, provider: inj.Provider) -> inj.Provider:
+        # Threads that share the state of this scope may ask for the same interface
+        # concurrently. The pending event ensures the instance is created once.
+        pending = _Pending()
+        setattr(self._locals, key, pending)
+        try:
+            provider = inj.InstanceProvider(self._build(key, provider))
+        except BaseException as e:
+            delattr(self._locals, key)
+            pending.send_exception(e)
+            raise
+        setattr(self._locals, key, provider)
+        pending.send(provider)
+        return provider
+
+    def _build(self, key: str, provider: inj.Provider) -> t.Any:
+        return provider.get(self.injector)
+
+
+class ResourceLimit(t.NamedTuple):
+    """Limit of instances of a binding that exist at once across the requests."""
+
+    max_instances: int
+    # Seconds to wait for a free slot, wait as long as needed if not set.
+    timeout: t.Optional[float] = None
+
+
+class ResourceLimitStats(t.NamedTuple):
+    """Metrics of the admission to a limited binding."""
+
+    in_use: int
+    # Requests waiting for a free slot right now.
+    waiting: int
+    acquired: int
+    rejected: int
+    # Total seconds spent by the requests waiting for a free slot.
+    wait_time: float
+
+
+class _Admission:
+    def __init__(self, interface: t.Any, limit: ResourceLimit) -> None:
+        self.interface = interface
+        self.limit = limit
+        self._slots = semaphore.Semaphore(limit.max_instances)
+        self._acquired = 0
+        self._rejected = 0
+        self._wait_time = 0.0
+
+    def acquire(self) -> None:
+        started = time.monotonic()
+        acquired = self._slots.acquire(timeout=self.limit.timeout)
+        waited = time.monotonic() - started
+        self._wait_time += waited
+        if not acquired:
+            self._rejected += 1
+            raise ResourceLimitExceededError(self.interface, self.limit)
+        self._acquired += 1
+        _LOGGER.debug("Acquired slot for %r in %.3f sec.", self.interface, waited)
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def stats(self) -> ResourceLimitStats:
+        return ResourceLimitStats(
+            in_use=self.limit.max_instances - self._slots.counter,
+            # balance of the semaphore also subtracts the blocked green threads
+            waiting=self._slots.counter - self._slots.balance,
+            acquired=self._acquired,
+            rejected=self._rejected,
+            wait_time=self._wait_time,
+        )
 
 
 class ResourceAwareRequestScope(RequestScope):
@@ -56,16 +179,91 @@ class ResourceAwareRequestScope(RequestScope):
 
     Resource is a instance created in this scope that has 'close' method. This method
     will be called in the end of the request.
+
+    Number of instances of a binding that exist at once can be limited, see
+    NamekoInjector.limit_resource. A slot is acquired when the instance is created and
+    released when the scope of the request is torn down.
     """
 
+    # Key in the storage of the request for admissions to the limited bindings.
+    _ADMITTED = "nameko_injector.admitted"
+
+    def configure(self) -> None:
+        super().configure()
+        self._admissions: t.Dict[str, _Admission] = {}
+
+    def limit(self, interface: t.Any, limit: ResourceLimit) -> None:
+        self._admissions[repr(interface)] = _Admission(interface, limit)
+
+    def limit_stats(self, interface: t.Any) -> ResourceLimitStats:
+        return self._admissions[repr(interface)].stats()
+
+    def _build(self, key: str, provider: inj.Provider) -> t.Any:
+        # Called while the pending marker is set, so threads of the same request
+        # wait for the instance instead of a slot held by the request itself.
+        admission = self._admissions.get(key)
+        if admission is None:
+            return super()._build(key, provider)
+        admission.acquire()
+        try:
+            instance = super()._build(key, provider)
+        except BaseException:
+            admission.release()
+            raise
+        admitted = getattr(self._locals, self._ADMITTED, None)
+        if admitted is None:
+            admitted = []
+            setattr(self._locals, self._ADMITTED, admitted)
+        admitted.append(admission)
+        return instance
+
     def iter_closable(self):
-        for provider in vars(self._locals).values():
-            if isinstance(provider, inj.InstanceProvider):
-                inst = provider.get(self.injector)
-                if hasattr(inst, "close"):
-                    yield inst
+        for inst in self.iter_instances():
+            if hasattr(inst, "close"):
+                yield inst
+
+    def pop_slots(self) -> t.List[_Admission]:
+        """Return slots acquired by the current request to be released by caller."""
+        admitted = getattr(self._locals, self._ADMITTED, [])
+        setattr(self._locals, self._ADMITTED, [])
+        return admitted
+
 
+class LockFreeSingletonScope(inj.SingletonScope):
+    """Singleton scope that takes the lock only to create an instance.
 
+    injector.SingletonScope takes a process-wide lock on each access. Here built
+    instances are served from a snapshot that is replaced on each creation and never
+    changed, so reading it needs no lock.
+    """
+
+    def configure(self) -> None:
+        super().configure()
+        self._snapshot: t.Dict[t.Any, inj.Provider] = {}
+
+    def get(self, key: t.Any, provider: inj.Provider) -> inj.Provider:
+        try:
+            return self._snapshot[key]
+        except KeyError:
+            pass
+        return self._get_and_publish(key, provider)
+
+    @inj.synchronized(inj.lock)
+    def _get_and_publish(self, key: t.Any, provider: inj.Provider) -> inj.Provider:
+        # Publishing under the lock keeps a discarded instance out of the snapshot.
+        provider = super().get(key, provider)
+        self._snapshot = {**self._snapshot, key: provider}
+        return provider
+
+    @inj.synchronized(inj.lock)
+    def discard(self, key: t.Any) -> t.Any:
+        """Forget the instance built for key and return it, None if it wasn't built."""
+        provider = self._context.pop(key, None)
+        self._snapshot = {k: v for k, v in self._snapshot.items() if k != key}
+        return None if provider is None else provider.get(self.injector)
+
+
+singleton_scope = inj.ScopeDecorator(LockFreeSingletonScope)
 request_scope = inj.ScopeDecorator(RequestScope)
 # In this early stage of the project it's decided to have a separate scope instead of
 # supporting the case in the existing `RequestScope`.
@@ -85,10 +283,214 @@ class MissingInRequestScopeError(BaseError):
         raise self
 
 
+class DeadlineExceededError(BaseError):
+    def __init__(self, seconds: float):
+        super().__init__(f"Dependencies were not resolved within {seconds} sec.")
+        self.seconds = seconds
+
+
+class ResourceLimitExceededError(BaseError):
+    def __init__(self, interface, limit: ResourceLimit):
+        super().__init__(
+            f"No free slot for {interface} within {limit.timeout} sec. "
+            f"All {limit.max_instances} allowed instances are in use by other requests."
+        )
+        self.interface = interface
+        self.limit = limit
+
+
+def resolve_concurrently(fn):
+    """Mark the entrypoint to resolve its dependencies concurrently.
+
+    Each injected parameter is resolved in its own green thread, so the latency of
+    resolution is the latency of the slowest dependency instead of their sum.
+    """
+    fn.nameko_injector_concurrent = True
+    return fn
+
+
+def _iter_request_scopes(injector: inj.Injector) -> t.Iterator[RequestScope]:
+    # Scopes are bound per binder, a child injector (see injector_in_test) has own
+    # scope instances while bindings of the parent still use the parent's ones.
+    while injector is not None:
+        yield injector.get(RequestScope)
+        yield injector.get(ResourceAwareRequestScope)
+        injector = injector.parent
+
+
+def resolution_deadline(seconds: float):
+    """Limit time resolution of dependencies of the entrypoint may take.
+
+    When the deadline is exceeded, resolution fails with DeadlineExceededError.
+    Providers can inject Deadline to pass the remaining time to their clients.
+    """
+
+    def mark(fn):
+        fn.nameko_injector_deadline = seconds
+        return fn
+
+    return mark
+
+
+class Deadline:
+    """Point in time resolution of the dependencies in the request must finish by."""
+
+    def __init__(self, seconds: t.Optional[float]) -> None:
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> t.Optional[float]:
+        """Return seconds left or None if resolution time is not limited."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+def _no_deadline() -> Deadline:
+    return Deadline(None)
+
+
+@contextlib.contextmanager
+def _deadline(injector: inj.Injector, seconds: t.Optional[float]):
+    if seconds is None:
+        yield
+        return
+    scope = injector.get(RequestScope)
+    scope._set(Deadline, inj.InstanceProvider(Deadline(seconds)))
+    # Timeout is a BaseException, so providers handling Exception to fall back or
+    # retry can't swallow it. It becomes DeadlineExceededError out of the block.
+    timeout = eventlet.Timeout(seconds)
+    try:
+        yield
+    except eventlet.Timeout as e:
+        if e is not timeout:
+            raise
+        raise DeadlineExceededError(seconds) from None
+    finally:
+        timeout.cancel()
+
+
+def _needed_bindings(fn, args, kwargs) -> t.Dict[str, t.Any]:
+    """Return bindings of parameters of fn that are not provided by the caller."""
+    provided = inspect.signature(fn).bind_partial(*args).arguments
+    return {
+        name: interface
+        for name, interface in inj.get_bindings(fn).items()
+        if name not in kwargs and name not in provided
+    }
+
+
+def _inherit_request_scopes(injector: inj.Injector):
+    """Return decorator running a function with request scopes of the caller.
+
+    Instances created by the decorated function in another green thread land in the
+    scopes of the request of the caller, so they are torn down once with the request.
+    """
+    states = [(scope, scope._get_state()) for scope in _iter_request_scopes(injector)]
+
+    def inherit(fn):
+        @functools.wraps(fn)
+        def in_request(*args, **kwargs):
+            for scope, state in states:
+                scope._adopt_state(state)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                for scope, _ in states:
+                    scope.remove_thread_ref()
+
+        return in_request
+
+    return inherit
+
+
+class RequestGreenPool(eventlet.GreenPool):
+    """Green pool which threads share the request scopes of the request.
+
+    Inject it in the entrypoint to fan out the work. Green threads of the pool get
+    WorkerContext, Request and other request-scoped instances of the request that
+    created the pool. Worker teardown waits for the threads before closing resources.
+    """
+
+    def __init__(self, injector: inj.Injector, size: int = 1000) -> None:
+        super().__init__(size)
+        self._inherit = _inherit_request_scopes(injector)
+
+    def spawn(self, function, *args, **kwargs):
+        return super().spawn(self._inherit(function), *args, **kwargs)
+
+    def spawn_n(self, function, *args, **kwargs):
+        return super().spawn_n(self._inherit(function), *args, **kwargs)
+
+
+@inj.provider
+def _provide_request_green_pool(injector: inj.Injector) -> RequestGreenPool:
+    return RequestGreenPool(injector)
+
+
+def _resolve_concurrently(injector: inj.Injector, needed: t.Dict) -> t.Dict:
+    """Resolve each of the needed bindings in a green thread."""
+
+    @_inherit_request_scopes(injector)
+    def resolve(interface):
+        try:
+            return injector.get(interface), None
+        except Exception as e:
+            return None, e
+
+    threads = [
+        (name, eventlet.spawn(resolve, interface)) for name, interface in needed.items()
+    ]
+    # Wait for all the threads so every created resource is in the scope by the time
+    # of the teardown. The error of the first failed parameter in the signature order
+    # is raised regardless of the order the threads finished in.
+    try:
+        results = [(name, thread.wait()) for name, thread in threads]
+    except BaseException:
+        # The caller is interrupted, e.g. by the deadline, stop the resolution.
+        for _, thread in threads:
+            thread.kill()
+        raise
+    errors = [error for _, (_, error) in results if error is not None]
+    if errors:
+        raise errors[0]
+    return {name: instance for name, (instance, _) in results}
+
+
+class _CloseAfterResponse:
+    """Close resources of the request when both its teardown and response are done."""
+
+    def __init__(self) -> None:
+        self._resources: t.Optional[t.Tuple[t.List, t.List[_Admission]]] = None
+        self._response_closed = False
+
+    def response_closed(self) -> None:
+        self._response_closed = True
+        self._close()
+
+    def torn_down(self, closables, slots) -> None:
+        self._resources = (closables, slots)
+        self._close()
+
+    def _close(self) -> None:
+        if self._response_closed and self._resources is not None:
+            resources, self._resources = self._resources, None
+            _close_resources(*resources)
+
+
 class NamekoInjector(inj.Injector):
     def __init__(self, modules, *args, **kwargs):
+        # The instance is shared between concurrent service calls so the stack used
+        # by injector to detect circular dependencies has to be per green thread.
+        # The stack is read on each resolution, plain dict is much cheaper than
+        # corolocal.local here and the entry is removed once the stack is empty.
+        self._stacks: t.Dict[t.Any, t.Tuple] = {}
+        self._closed_on_stop: t.List[t.Any] = []
         super().__init__(modules, *args, **kwargs)
         self._modules = modules
+        # Bindings with injector.singleton scope use the lock-free one as well.
+        singleton = LockFreeSingletonScope(self)
+        self.binder.bind(inj.SingletonScope, to=singleton)
+        self.binder.bind(LockFreeSingletonScope, to=singleton)
         # This instance of injector will be shared between the service calls.
         # NamekoInjectorProvider has a special logic to ensure that instances of these
         # interfaces are injected properly from the request_scope.
@@ -104,6 +506,11 @@ class NamekoInjector(inj.Injector):
             to=MissingInRequestScopeError(WorkerContext).provider,
             scope=request_scope,
         )
+        # Entrypoints with resolution_deadline put own instance in the request scope.
+        self.binder.bind(Deadline, to=_no_deadline, scope=request_scope)
+        self.binder.bind(
+            RequestGreenPool, to=_provide_request_green_pool, scope=request_scope
+        )
 
     def decorate_service(self, service_cls):
         service_cls.injector = NamekoInjectorProvider(self)
@@ -111,11 +518,66 @@ class NamekoInjector(inj.Injector):
         for member_name in dir(service_cls):
             member = getattr(service_cls, member_name)
             if callable(member) and getattr(member, "nameko_entrypoints", 0):
-                setattr(service_cls, member_name, self.inject(member))
+                decorated = self.inject(
+                    member,
+                    concurrent=getattr(member, "nameko_injector_concurrent", False),
+                    deadline=getattr(member, "nameko_injector_deadline", None),
+                )
+                setattr(service_cls, member_name, decorated)
 
         return service_cls
 
-    def inject(self, fn):
+    @property
+    def _stack(self):
+        return self._stacks.get(greenthread.getcurrent(), ())
+
+    @_stack.setter
+    def _stack(self, value):
+        if value:
+            self._stacks[greenthread.getcurrent()] = value
+        else:
+            self._stacks.pop(greenthread.getcurrent(), None)
+
+    def limit_resource(
+        self,
+        interface: t.Any,
+        max_instances: int,
+        timeout: t.Optional[float] = None,
+    ) -> None:
+        """Limit number of instances of a resource_request_scope binding at once.
+
+        When all the slots are in use, creation of the instance in a request waits for
+        a free one up to 'timeout' seconds and fails with ResourceLimitExceededError.
+        """
+        try:
+            binding, _ = self.binder._get_binding(interface)
+        except KeyError:
+            binding = None
+        if binding is None or not issubclass(binding.scope, ResourceAwareRequestScope):
+            # Only resource_request_scope acquires and releases the slots.
+            raise ValueError(
+                f"{interface} must be bound in resource_request_scope to be limited."
+            )
+        self.get(ResourceAwareRequestScope).limit(
+            interface, ResourceLimit(max_instances=max_instances, timeout=timeout)
+        )
+
+    def close_on_stop(self, interface: t.Any) -> None:
+        """Forget the singleton of interface when the service container stops.
+
+        The instance is closed if it has 'close' method. The container started again
+        creates a new one from its own config.
+        """
+        if interface not in self._closed_on_stop:
+            self._closed_on_stop.append(interface)
+
+    # injector.Injector serialises these methods with a process-wide lock. The state
+    # they change is per green thread here, and holding the lock while a provider
+    # waits for I/O would block resolution in all the other green threads.
+    get = inj.Injector.get.__wrapped__
+    args_to_inject = inj.Injector.args_to_inject.__wrapped__
+
+    def inject(self, fn, concurrent=False, deadline=None):
         inj.inject(fn)
 
         @functools.wraps(fn)
@@ -124,10 +586,29 @@ class NamekoInjector(inj.Injector):
             service_instance = args[0]
             # Child injector by NamekoInjectorProvider
             instance_injector = service_instance.injector
+            if concurrent or deadline is not None:
+                needed = _needed_bindings(fn, args, kwargs)
+                with _deadline(self, deadline):
+                    if concurrent:
+                        resolved = _resolve_concurrently(instance_injector, needed)
+                    else:
+                        resolved = instance_injector.args_to_inject(
+                            function=fn, bindings=needed, owner_key=fn.__module__
+                        )
+                kwargs = dict(kwargs, **resolved)
             # use it to resolve the dependencies
-            return instance_injector.call_with_injection(
+            result = instance_injector.call_with_injection(
                 callable=fn, args=args, kwargs=kwargs
             )
+            if isinstance(result, Response) and result.is_streamed:
+                # Register the hook before nameko gets the response, the server may
+                # send and close it as soon as any of the providers yields.
+                closing = _CloseAfterResponse()
+                result.call_on_close(closing.response_closed)
+                instance_injector.get(request_scope.scope)._set(
+                    _CloseAfterResponse, inj.InstanceProvider(closing)
+                )
+            return result
 
         return decorated
 
@@ -137,10 +618,23 @@ class NamekoInjectorProvider(DependencyProvider):
         self.injector = injector
 
     def setup(self):
+        # The singleton scope keeps serving the container of the previous start.
+        self.injector.get(LockFreeSingletonScope).discard(ServiceContainer)
         self.injector.binder.bind(
-            ServiceContainer, to=self.container, scope=inj.singleton
+            ServiceContainer, to=self.container, scope=singleton_scope
         )
 
+    def stop(self):
+        scope = self.injector.get(LockFreeSingletonScope)
+        for interface in self.injector._closed_on_stop:
+            instance = scope.discard(interface)
+            if not hasattr(instance, "close"):
+                continue
+            try:
+                instance.close()
+            except Exception:
+                _LOGGER.exception("Failed to close %r on container stop.", interface)
+
     def get_dependency(self, worker_ctx):
         # The injector is shared between the service calls therefore we cannot use bind
         # InstanceProvider with the binder. Binding to a specific instance in one call
@@ -158,20 +652,44 @@ class NamekoInjectorProvider(DependencyProvider):
 
     def worker_teardown(self, worker_ctx):
         """Called after a service worker has executed a task."""
-        self.injector.get(request_scope.scope).remove_thread_ref()
+        scope_instance = self.injector.get(request_scope.scope)
+        closing = None
+        # Green threads spawned in the request use its resources, let them finish.
+        for instance in scope_instance.iter_instances():
+            if isinstance(instance, RequestGreenPool):
+                instance.waitall()
+            elif isinstance(instance, _CloseAfterResponse):
+                closing = instance
+        scope_instance.remove_thread_ref()
         scope = self.injector.get(ResourceAwareRequestScope)
 
         try:
-            for closable in scope.iter_closable():
-                try:
-                    closable.close()
-                except Exception:
-                    _LOGGER.exception(
-                        "Failed to close request-scoped resource %r on worker teardown."
-                        " Will attempt to close the rest of resources in this scope.",
-                        closable.__class__,
-                    )
+            closables = list(scope.iter_closable())
+            slots = scope.pop_slots()
         finally:
             # ensure that we remove state for the current thread from scope to avoid
             # memory leaks for cases when resource failed to clean up
             scope.remove_thread_ref()
+
+        if closing is None:
+            _close_resources(closables, slots)
+        else:
+            # Body of the streamed response is read from the resources after the
+            # entrypoint returned. Close them once the response is sent or aborted.
+            closing.torn_down(closables, slots)
+
+
+def _close_resources(closables, slots) -> None:
+    try:
+        for closable in closables:
+            try:
+                closable.close()
+            except Exception:
+                _LOGGER.exception(
+                    "Failed to close request-scoped resource %r on worker teardown."
+                    " Will attempt to close the rest of resources in this scope.",
+                    closable.__class__,
+                )
+    finally:
+        for slot in slots:
+            slot.release()
@@ -0,0 +1,295 @@
+"""Report the dependency graphs of entrypoints of decorated services.
+
+Run with ``python -m nameko_injector.report module[:ServiceClass]``. The module is
+imported the same way ``nameko run`` does it, no service is started and nothing is
+instantiated. For each entrypoint the report lists the transitive closure of its
+dependencies with the scope of each of them and flags:
+
+- request-scoped dependencies that depend only on singletons and could be promoted
+  to singletons, except closable ones which are closed on teardown of the request,
+- closable dependencies injected into a function that never reads them,
+- graphs deeper than ``--max-depth``,
+- dependencies that can't be resolved, including circular ones.
+"""
+import argparse
+import dis
+import inspect
+import json
+import sys
+import typing as t
+
+import injector as inj
+from nameko.cli.run import import_service
+from nameko.containers import ServiceContainer, WorkerContext
+from nameko.exceptions import CommandError
+from werkzeug.wrappers import Request
+
+from .core import (
+    Deadline,
+    NamekoInjectorProvider,
+    RequestGreenPool,
+    RequestScope,
+    ResourceAwareRequestScope,
+)
+
+# Scopes in which instances are created for each request.
+PER_REQUEST_SCOPES = ("request", "resource_request", "noscope")
+# Values of the request put in the scope by the library, never promotable.
+_REQUEST_VALUES = (Request, WorkerContext, Deadline, RequestGreenPool)
+# LOAD_FAST_CHECK, LOAD_FAST_LOAD_FAST (3.13) and LOAD_FAST_BORROW* (3.14) included.
+_LOAD_ARGUMENT = ("LOAD_FAST", "LOAD_DEREF", "LOAD_CLOSURE")
+
+
+class Node(t.NamedTuple):
+    interface: str
+    scope: str
+    closable: bool
+    depends_on: t.List[str]
+
+
+class Finding(t.NamedTuple):
+    kind: str
+    interface: str
+    message: str
+
+
+class EntrypointReport(t.NamedTuple):
+    service: str
+    entrypoint: str
+    # Parameters of the entrypoint mapped to the injected interfaces.
+    parameters: t.Dict[str, str]
+    depth: int
+    # Number of dependencies created for each call of the entrypoint.
+    per_request: int
+    nodes: t.List[Node]
+    findings: t.List[Finding]
+
+    def as_json(self) -> str:
+        data = self._asdict()
+        data["nodes"] = [node._asdict() for node in self.nodes]
+        data["findings"] = [finding._asdict() for finding in self.findings]
+        return json.dumps(data)
+
+
+def iter_decorated_services(module_name: str) -> t.Iterator[type]:
+    """Import services like 'nameko run' and keep ones with NamekoInjector."""
+    for service_cls in import_service(module_name):
+        if isinstance(vars(service_cls).get("injector"), NamekoInjectorProvider):
+            yield service_cls
+
+
+def report_service(service_cls, max_depth: int = 5) -> t.List[EntrypointReport]:
+    injector = service_cls.injector.injector
+    reports = []
+    for member_name in dir(service_cls):
+        member = getattr(service_cls, member_name)
+        if callable(member) and getattr(member, "nameko_entrypoints", None):
+            fn = inspect.unwrap(member)
+            graph = _Graph(injector.binder)
+            parameters = inj.get_bindings(fn)
+            depth = max(
+                [graph.visit(fn, name, iface) for name, iface in parameters.items()],
+                default=0,
+            )
+            if depth > max_depth:
+                graph.findings.append(
+                    Finding(
+                        "deep",
+                        member_name,
+                        f"depth of the graph {depth} exceeds {max_depth}",
+                    )
+                )
+            reports.append(
+                EntrypointReport(
+                    service=service_cls.name,
+                    entrypoint=member_name,
+                    parameters={n: _name(i) for n, i in parameters.items()},
+                    depth=depth,
+                    per_request=sum(
+                        node.scope in PER_REQUEST_SCOPES for node in graph.nodes
+                    ),
+                    nodes=graph.nodes,
+                    findings=graph.findings,
+                )
+            )
+    return reports
+
+
+class _Graph:
+    """Transitive closure of dependencies of an entrypoint."""
+
+    def __init__(self, binder: inj.Binder) -> None:
+        self._binder = binder
+        self._depths: t.Dict[str, int] = {}
+        self._path: t.List[str] = []
+        self.nodes: t.List[Node] = []
+        self.findings: t.List[Finding] = []
+
+    def visit(self, consumer, parameter: str, interface) -> int:
+        """Visit the dependency injected as parameter, return depth of its graph."""
+        name = _name(interface)
+        if _is_closable(interface) and not _reads_argument(consumer, parameter):
+            self.findings.append(
+                Finding(
+                    "unused_closable",
+                    name,
+                    f"'{parameter}' of {_name(consumer)} is created but never used",
+                )
+            )
+        if name in self._path:
+            cycle = " -> ".join(self._path[self._path.index(name) :] + [name])
+            self.findings.append(Finding("cycle", name, cycle))
+            return 0
+        if name not in self._depths:
+            self._path.append(name)
+            try:
+                self._depths[name] = self._add(interface, name)
+            finally:
+                self._path.pop()
+        return self._depths[name]
+
+    def _add(self, interface, name: str) -> int:
+        try:
+            scope, factory = self._resolve(interface)
+        except (inj.Error, TypeError) as e:
+            self.findings.append(Finding("unsatisfied", name, str(e)))
+            scope, factory = "unsatisfied", None
+        dependencies = inj.get_bindings(factory) if factory else {}
+        # Placeholder keeps the order in which dependencies are visited.
+        index = len(self.nodes)
+        self.nodes.append(Node(name, scope, _is_closable(interface), []))
+        depth = 1 + max(
+            [self.visit(factory, p, dep) for p, dep in dependencies.items()],
+            default=0,
+        )
+        depends_on = [_name(dep) for dep in dependencies.values()]
+        self.nodes[index] = self.nodes[index]._replace(depends_on=depends_on)
+        scopes = {node.interface: node.scope for node in self.nodes}
+        if (
+            scope in ("request", "resource_request")
+            and depends_on
+            and all(scopes.get(dep) in ("singleton", "instance") for dep in depends_on)
+            and interface not in _REQUEST_VALUES
+            and not _is_closable(interface)
+        ):
+            self.findings.append(
+                Finding(
+                    "promotable",
+                    name,
+                    f"{scope} scope but depends only on singletons: "
+                    + ", ".join(depends_on),
+                )
+            )
+        return depth
+
+    def _resolve(self, interface) -> t.Tuple[str, t.Optional[t.Callable]]:
+        """Return scope of the binding and the callable the injector calls."""
+        try:
+            binding, _ = self._binder._get_binding(interface)
+        except KeyError:
+            if interface is ServiceContainer:
+                # Bound by NamekoInjectorProvider when the container is set up.
+                return "singleton", None
+            if not self._binder._auto_bind:
+                raise inj.UnsatisfiedRequirement(None, interface)
+            # Implicit binding isn't stored, the report leaves the binder as it is.
+            binding = self._binder.create_binding(interface)
+        return _scope_name(binding), _factory(binding.provider)
+
+
+def _scope_name(binding: inj.Binding) -> str:
+    if isinstance(binding.provider, inj.InstanceProvider):
+        return "instance"
+    if issubclass(binding.scope, ResourceAwareRequestScope):
+        return "resource_request"
+    if issubclass(binding.scope, RequestScope):
+        return "request"
+    if issubclass(binding.scope, inj.SingletonScope):
+        return "singleton"
+    if issubclass(binding.scope, inj.NoScope):
+        return "noscope"
+    return binding.scope.__name__
+
+
+def _factory(provider: inj.Provider) -> t.Optional[t.Callable]:
+    if isinstance(provider, inj.ClassProvider):
+        init = provider._cls.__init__
+        return init if inspect.isfunction(init) else None
+    if isinstance(provider, inj.CallableProvider):
+        return provider._callable
+    return None
+
+
+def _is_closable(interface) -> bool:
+    return isinstance(interface, type) and callable(getattr(interface, "close", None))
+
+
+def _reads_argument(fn, name: str) -> bool:
+    code = getattr(inspect.unwrap(getattr(fn, "__func__", fn)), "__code__", None)
+    if code is None:
+        return True
+    for instruction in dis.get_instructions(code):
+        if instruction.opname.startswith(_LOAD_ARGUMENT):
+            # Super-instructions load several variables at once.
+            argval = instruction.argval
+            if name in (argval if isinstance(argval, tuple) else (argval,)):
+                return True
+    return False
+
+
+def _name(obj) -> str:
+    qualname = getattr(obj, "__qualname__", None)
+    if qualname is None:
+        return repr(obj)
+    return f"{obj.__module__}.{qualname}"
+
+
+def format_report(report: EntrypointReport) -> t.Iterator[str]:
+    yield (
+        f"{report.service}.{report.entrypoint} "
+        f"depth={report.depth} per_request={report.per_request}"
+    )
+    nodes = {node.interface: node for node in report.nodes}
+
+    def tree(path, label):
+        node = nodes[path[-1]]
+        flags = ", closable" if node.closable else ""
+        yield f"{'  ' * len(path)}{label}{node.interface} [{node.scope}{flags}]"
+        for dependency in node.depends_on:
+            # circular dependency is reported as a finding
+            if dependency not in path:
+                yield from tree(path + [dependency], "")
+
+    for parameter, interface in report.parameters.items():
+        yield from tree([interface], f"{parameter}: ")
+    for finding in report.findings:
+        yield f"  ! {finding.kind} {finding.interface}: {finding.message}"
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m nameko_injector.report",
+        description="Report dependency graphs of entrypoints of decorated services.",
+    )
+    parser.add_argument("services", nargs="+", metavar="module[:ServiceClass]")
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args(argv)
+
+    if "." not in sys.path:
+        sys.path.insert(0, ".")
+    for module_name in args.services:
+        try:
+            services = list(iter_decorated_services(module_name))
+        except CommandError as e:
+            parser.error(str(e))
+        for service_cls in services:
+            for report in report_service(service_cls, args.max_depth):
+                if args.json:
+                    print(report.as_json())
+                else:
+                    print("\n".join(format_report(report)))
+
+
+if __name__ == "__main__":
+    main()
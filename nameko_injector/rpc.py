@@ -0,0 +1,211 @@
+"""Injectable nameko RPC proxies and event dispatcher.
+
+Standalone RPC proxy opens a connection to the broker when started. Instead of a
+proxy per request, AmqpModule binds a pool of started proxies configured from the
+config of the bound ServiceContainer. The proxy is borrowed from the pool for a
+request and returned to it when the request is torn down.
+"""
+import logging
+import typing as t
+
+import injector as inj
+from eventlet import semaphore
+from nameko.containers import ServiceContainer
+from nameko.standalone.events import event_dispatcher
+from nameko.standalone.rpc import ClusterRpcProxy
+
+from .core import (
+    NamekoInjector,
+    ResourceLimit,
+    ResourceLimitExceededError,
+    resource_request_scope,
+    singleton_scope,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def is_connected(standalone: ClusterRpcProxy) -> bool:
+    """Check the connection of the started standalone proxy to the broker."""
+    consumer = getattr(standalone._reply_listener, "queue_consumer", None)
+    connection = getattr(consumer, "connection", None)
+    return connection is not None and connection.connected
+
+
+class RpcProxyPool:
+    """Pool of started cluster RPC proxies shared between the requests.
+
+    Standalone proxy is single-threaded, so one is used by one request at a time and
+    at most 'size' of them exist at once. Idle proxy is checked with 'health_check'
+    before it's given out and is replaced with a new one if the check fails.
+    """
+
+    def __init__(
+        self,
+        config: t.Mapping,
+        size: int = 10,
+        timeout: t.Optional[float] = None,
+        acquire_timeout: t.Optional[float] = None,
+        proxy_factory: t.Callable = ClusterRpcProxy,
+        health_check: t.Callable[[t.Any], bool] = is_connected,
+    ) -> None:
+        self.config = config
+        self.size = size
+        # RPC timeout for the calls made with proxies of this pool
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self._proxy_factory = proxy_factory
+        self._health_check = health_check
+        self._slots = semaphore.Semaphore(size)
+        self._idle: t.List[t.Tuple[t.Any, t.Any]] = []
+        self._closed = False
+
+    def acquire(self) -> "PooledRpcProxy":
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise ResourceLimitExceededError(
+                PooledRpcProxy, ResourceLimit(self.size, self.acquire_timeout)
+            )
+        try:
+            standalone, proxy = self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+        return PooledRpcProxy(self, standalone, proxy)
+
+    def release(self, standalone, proxy) -> None:
+        try:
+            if self._closed:
+                self._stop(standalone)
+            else:
+                self._idle.append((standalone, proxy))
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        """Stop idle proxies, proxies in use are stopped when released."""
+        self._closed = True
+        while self._idle:
+            self._stop(self._idle.pop()[0])
+
+    def _checkout(self):
+        while self._idle:
+            standalone, proxy = self._idle.pop()
+            if self._health_check(standalone):
+                return standalone, proxy
+            _LOGGER.info("Replacing unhealthy RPC proxy %r in the pool.", standalone)
+            self._stop(standalone)
+        standalone = self._proxy_factory(self.config, timeout=self.timeout)
+        return standalone, standalone.start()
+
+    def _stop(self, standalone) -> None:
+        try:
+            standalone.stop()
+        except Exception:
+            _LOGGER.exception("Failed to stop RPC proxy %r.", standalone)
+
+
+class PooledRpcProxy:
+    """Cluster RPC proxy borrowed from the pool.
+
+    Services are accessed the same way as with nameko's ClusterRpcProxy,
+    'proxy.service_name.method(...)'. The proxy is returned to the pool on 'close'.
+    """
+
+    def __init__(self, pool: RpcProxyPool, standalone, proxy) -> None:
+        self._pool = pool
+        self._standalone = standalone
+        self._proxy = proxy
+
+    def __getattr__(self, name):
+        return getattr(self._proxy, name)
+
+    def __getitem__(self, name):
+        return self._proxy[name]
+
+    def close(self) -> None:
+        if self._standalone is not None:
+            standalone, self._standalone = self._standalone, None
+            self._pool.release(standalone, self._proxy)
+
+
+class EventDispatcher:
+    """Dispatch events on behalf of the service.
+
+    The dispatcher is shared between the requests, connections to the broker are
+    reused from kombu's connection and producer pools.
+    """
+
+    def __init__(
+        self,
+        service_name: str,
+        config: t.Mapping,
+        dispatcher_factory: t.Callable = event_dispatcher,
+    ) -> None:
+        self.service_name = service_name
+        self._dispatch = dispatcher_factory(config)
+
+    def __call__(self, event_type: str, event_data: t.Any) -> None:
+        self._dispatch(self.service_name, event_type, event_data)
+
+
+class AmqpModule(inj.Module):
+    """Bindings for pooled RPC proxies and event dispatcher.
+
+    PooledRpcProxy is bound in resource_request_scope, RpcProxyPool and
+    EventDispatcher are singletons configured from the ServiceContainer config. The
+    pool is closed and both are forgotten when the service container stops.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeout: t.Optional[float] = None,
+        acquire_timeout: t.Optional[float] = None,
+        proxy_factory: t.Callable = ClusterRpcProxy,
+        health_check: t.Callable[[t.Any], bool] = is_connected,
+        dispatcher_factory: t.Callable = event_dispatcher,
+    ) -> None:
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.proxy_factory = proxy_factory
+        self.health_check = health_check
+        self.dispatcher_factory = dispatcher_factory
+
+    def configure(self, binder: inj.Binder) -> None:
+        binder.bind(
+            RpcProxyPool, to=self._provide_rpc_proxy_pool, scope=singleton_scope
+        )
+        binder.bind(
+            PooledRpcProxy, to=self._provide_rpc_proxy, scope=resource_request_scope
+        )
+        binder.bind(
+            EventDispatcher, to=self._provide_event_dispatcher, scope=singleton_scope
+        )
+        # Child injectors (e.g. injector_in_test) are not bound to a container.
+        if isinstance(binder.injector, NamekoInjector):
+            binder.injector.close_on_stop(RpcProxyPool)
+            binder.injector.close_on_stop(EventDispatcher)
+
+    @inj.provider
+    def _provide_rpc_proxy_pool(self, container: ServiceContainer) -> RpcProxyPool:
+        return RpcProxyPool(
+            container.config,
+            size=self.pool_size,
+            timeout=self.timeout,
+            acquire_timeout=self.acquire_timeout,
+            proxy_factory=self.proxy_factory,
+            health_check=self.health_check,
+        )
+
+    @inj.provider
+    def _provide_rpc_proxy(self, pool: RpcProxyPool) -> PooledRpcProxy:
+        return pool.acquire()
+
+    @inj.provider
+    def _provide_event_dispatcher(self, container: ServiceContainer) -> EventDispatcher:
+        return EventDispatcher(
+            container.service_name,
+            container.config,
+            dispatcher_factory=self.dispatcher_factory,
+        )
@@ -28,6 +28,11 @@ def main():
         packages=find_packages(),
         py_modules=["nameko_injector"],
         install_requires=["nameko>=2.0.0", "injector>=0.18.0"],
+        entry_points={
+            "console_scripts": [
+                "nameko-injector-report=nameko_injector.report:main",
+            ]
+        },
     )
 
 
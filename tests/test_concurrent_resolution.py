@@ -0,0 +1,220 @@
+"""Test dependencies of an entrypoint can be resolved concurrently."""
+import json
+import time
+import typing as t
+from unittest import mock
+
+import eventlet
+import injector as inj
+import pytest
+from nameko.web.handlers import http
+from nameko_injector.core import (
+    NamekoInjector,
+    request_scope,
+    resolve_concurrently,
+    resource_request_scope,
+)
+
+# Each of the slow dependencies waits for I/O for this amount of seconds.
+_DELAY = 0.2
+
+
+def test_dependencies_resolved_concurrently(web_service, web_session):
+    # When
+    started = time.monotonic()
+    response = web_session.get("/profile")
+    elapsed = time.monotonic() - started
+    # Then
+    assert 200 == response.status_code, str(response.content)
+    # Resolved serially it would take 3 * _DELAY
+    assert elapsed < 2 * _DELAY
+    body = response.json()
+    # Dependency shared by the branches is created once in the request scope.
+    assert body["profile_trace"] == body["permissions_trace"] == body["config_trace"]
+    assert 1 == TRACES.created
+    # Resource created in a green thread is closed in the end of the request.
+    SESSIONS[-1].spy.close.assert_called_once()
+
+
+def test_circular_dependency_between_branches(web_service, web_session):
+    # Each branch waits for the instance the other one is creating.
+    with eventlet.Timeout(_DELAY * 5):
+        response = web_session.get("/chicken/egg")
+    assert 500 == response.status_code
+    assert response.content.startswith(b"Error: CircularDependency: ")
+
+
+def test_first_error_in_signature_order_propagated(web_service, web_session):
+    response = web_session.get("/profile/failing")
+    assert 500 == response.status_code
+    # Permissions fail faster but profile is declared first.
+    assert b"Error: ValueError: profile failed\n" == response.content
+    SESSIONS[-1].spy.close.assert_called_once()
+
+
+class Trace:
+    def __init__(self):
+        self.spy = mock.Mock()
+
+
+class Session:
+    def __init__(self):
+        self.spy = mock.Mock()
+
+    def close(self):
+        self.spy.close()
+
+
+class Profile(str):
+    pass
+
+
+class Permissions(frozenset):
+    pass
+
+
+class RemoteConfig(dict):
+    pass
+
+
+class TraceCounter:
+    created = 0
+
+
+TRACES = TraceCounter()
+SESSIONS: t.List[Session] = []
+
+
+@inj.provider
+def provide_trace() -> Trace:
+    TRACES.created += 1
+    eventlet.sleep(_DELAY / 2)
+    return Trace()
+
+
+@inj.provider
+def provide_session() -> Session:
+    SESSIONS.append(Session())
+    return SESSIONS[-1]
+
+
+@inj.provider
+def provide_profile(trace: Trace, session: Session) -> Profile:
+    eventlet.sleep(_DELAY)
+    return Profile(id(trace))
+
+
+@inj.provider
+def provide_permissions(trace: Trace) -> Permissions:
+    eventlet.sleep(_DELAY)
+    return Permissions([id(trace)])
+
+
+@inj.provider
+def provide_remote_config(trace: Trace) -> RemoteConfig:
+    eventlet.sleep(_DELAY)
+    return RemoteConfig(trace=id(trace))
+
+
+class FailingProfile(Profile):
+    pass
+
+
+class FailingPermissions(Permissions):
+    pass
+
+
+@inj.provider
+def provide_failing_profile(trace: Trace, session: Session) -> FailingProfile:
+    eventlet.sleep(_DELAY)
+    raise ValueError("profile failed")
+
+
+@inj.provider
+def provide_failing_permissions(trace: Trace) -> FailingPermissions:
+    raise ValueError("permissions failed")
+
+
+class Chicken:
+    pass
+
+
+class Egg:
+    pass
+
+
+@inj.provider
+def provide_chicken(trace: Trace, egg: Egg) -> Chicken:
+    return Chicken()
+
+
+@inj.provider
+def provide_egg(trace: Trace, chicken: Chicken) -> Egg:
+    return Egg()
+
+
+def configure(binder):
+    binder.bind(Trace, to=provide_trace, scope=request_scope)
+    binder.bind(Session, to=provide_session, scope=resource_request_scope)
+    binder.bind(Profile, to=provide_profile, scope=request_scope)
+    binder.bind(Permissions, to=provide_permissions, scope=request_scope)
+    binder.bind(RemoteConfig, to=provide_remote_config, scope=request_scope)
+    binder.bind(FailingProfile, to=provide_failing_profile, scope=request_scope)
+    binder.bind(FailingPermissions, to=provide_failing_permissions, scope=request_scope)
+    binder.bind(Chicken, to=provide_chicken, scope=request_scope)
+    binder.bind(Egg, to=provide_egg, scope=request_scope)
+
+
+INJECTOR = NamekoInjector(configure)
+
+
+@INJECTOR.decorate_service
+class Service:
+    name = "service"
+
+    @resolve_concurrently
+    @http("GET", "/profile")
+    def view_profile(
+        self,
+        request,
+        profile: Profile,
+        permissions: Permissions,
+        config: RemoteConfig,
+    ):
+        return json.dumps(
+            dict(
+                profile_trace=int(profile),
+                permissions_trace=next(iter(permissions)),
+                config_trace=config["trace"],
+            )
+        )
+
+    @resolve_concurrently
+    @http("GET", "/profile/failing")
+    def view_failing_profile(
+        self, request, profile: FailingProfile, permissions: FailingPermissions
+    ):
+        return "unreachable"
+
+    @resolve_concurrently
+    @http("GET", "/chicken/egg")
+    def view_chicken_egg(self, request, chicken: Chicken, egg: Egg):
+        return "unreachable"
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    TRACES.created = 0
+    del SESSIONS[:]
+
+
+@pytest.fixture
+def service_class():
+    return Service
+
+
+@pytest.fixture
+def container_overridden_dependencies():
+    # Do not override NamekoInjectorProvider as it prevents calling of worker_* methods
+    # on the provider.
+    return {}
@@ -0,0 +1,162 @@
+"""Test resolution of dependencies is bounded by the deadline of the entrypoint."""
+import json
+import time
+import typing as t
+
+import eventlet
+import injector as inj
+import pytest
+from nameko.web.handlers import http
+from nameko_injector.core import (
+    Deadline,
+    NamekoInjector,
+    request_scope,
+    resolution_deadline,
+    resolve_concurrently,
+    resource_request_scope,
+)
+
+_DEADLINE = 0.2
+
+
+def test_resolution_fails_fast_after_deadline(web_service, web_session):
+    # When
+    started = time.monotonic()
+    response = web_session.get("/slow")
+    elapsed = time.monotonic() - started
+    # Then
+    assert 500 == response.status_code
+    assert response.content.startswith(b"Error: DeadlineExceededError: ")
+    assert elapsed < _DEADLINE * 2
+    # Resource created before the deadline is closed on teardown.
+    assert SESSIONS[-1].closed
+
+
+def test_concurrent_resolution_fails_fast_after_deadline(web_service, web_session):
+    started = time.monotonic()
+    response = web_session.get("/slow/concurrent")
+    elapsed = time.monotonic() - started
+    assert 500 == response.status_code
+    assert response.content.startswith(b"Error: DeadlineExceededError: ")
+    assert elapsed < _DEADLINE * 2
+    assert SESSIONS[-1].closed
+
+
+def test_deadline_not_swallowed_by_provider(web_service, web_session):
+    started = time.monotonic()
+    response = web_session.get("/slow/retrying")
+    elapsed = time.monotonic() - started
+    assert 500 == response.status_code
+    assert response.content.startswith(b"Error: DeadlineExceededError: ")
+    assert elapsed < _DEADLINE * 2
+
+
+def test_deadline_visible_to_providers(web_service, web_session):
+    response = web_session.get("/fast")
+    assert 200 == response.status_code, str(response.content)
+    assert 0 < response.json()["client_timeout"] <= _DEADLINE
+
+
+def test_no_deadline_by_default(injector_in_test):
+    assert injector_in_test.get(Deadline).remaining() is None
+
+
+class Session:
+    def __init__(self):
+        self.closed = False
+        SESSIONS.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+class SlowReport(str):
+    pass
+
+
+class RetriedReport(str):
+    pass
+
+
+class Client(t.NamedTuple):
+    timeout: t.Optional[float]
+
+
+SESSIONS: t.List[Session] = []
+
+
+@inj.provider
+def provide_slow_report(session: Session) -> SlowReport:
+    # the dependency is degraded and takes much longer than the deadline
+    eventlet.sleep(_DEADLINE * 10)
+    return SlowReport("report")
+
+
+@inj.provider
+def provide_retried_report() -> RetriedReport:
+    for _ in range(2):
+        try:
+            eventlet.sleep(_DEADLINE * 2)
+            break
+        except Exception:
+            # retry on any error of the client
+            continue
+    return RetriedReport("report")
+
+
+@inj.provider
+def provide_client(deadline: Deadline) -> Client:
+    return Client(timeout=deadline.remaining())
+
+
+def configure(binder):
+    binder.bind(Session, to=Session, scope=resource_request_scope)
+    binder.bind(SlowReport, to=provide_slow_report, scope=request_scope)
+    binder.bind(RetriedReport, to=provide_retried_report, scope=request_scope)
+    binder.bind(Client, to=provide_client, scope=request_scope)
+
+
+INJECTOR = NamekoInjector(configure)
+
+
+@INJECTOR.decorate_service
+class Service:
+    name = "service"
+
+    @resolution_deadline(_DEADLINE)
+    @http("GET", "/slow")
+    def view_slow(self, request, session: Session, report: SlowReport):
+        return report
+
+    @resolution_deadline(_DEADLINE)
+    @http("GET", "/slow/retrying")
+    def view_slow_retrying(self, request, report: RetriedReport):
+        return report
+
+    @resolve_concurrently
+    @resolution_deadline(_DEADLINE)
+    @http("GET", "/slow/concurrent")
+    def view_slow_concurrent(self, request, report: SlowReport, client: Client):
+        return report
+
+    @resolution_deadline(_DEADLINE)
+    @http("GET", "/fast")
+    def view_fast(self, request, client: Client):
+        return json.dumps({"client_timeout": client.timeout})
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    del SESSIONS[:]
+
+
+@pytest.fixture
+def service_class():
+    return Service
+
+
+@pytest.fixture
+def container_overridden_dependencies():
+    # Do not override NamekoInjectorProvider as it prevents calling of worker_* methods
+    # on the provider.
+    return {}
@@ -0,0 +1,106 @@
+"""Test green threads spawned in the request share its scopes."""
+
+import json
+import typing as t
+
+import eventlet
+import pytest
+from nameko.containers import WorkerContext
+from nameko.web.handlers import http
+from nameko_injector.core import (
+    NamekoInjector,
+    RequestGreenPool,
+    resource_request_scope,
+)
+
+
+def test_fan_out_shares_request_scope(web_service, web_session):
+    # When
+    response = web_session.get("/fan/out")
+    # Then
+    assert 200 == response.status_code, str(response.content)
+    body = response.json()
+    assert [body["call_id"]] * 3 == body["children_call_ids"]
+    # Children used the session of the request instead of creating own ones.
+    assert 1 == len(SESSIONS)
+    assert [id(SESSIONS[0])] * 3 == body["children_session_ids"]
+    assert SESSIONS[0].closed
+
+
+def test_teardown_waits_for_children(web_service, web_session):
+    response = web_session.get("/fire/and/forget")
+    assert 200 == response.status_code, str(response.content)
+    assert 1 == len(SESSIONS)
+    # Response is sent before the worker is torn down.
+    with eventlet.Timeout(1):
+        while not SESSIONS[0].closed:
+            eventlet.sleep(0.01)
+    # The child finished using the session before it was closed on teardown.
+    assert [False] == USED_CLOSED_SESSION
+
+
+class Session:
+    def __init__(self):
+        self.closed = False
+        SESSIONS.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+SESSIONS: t.List[Session] = []
+USED_CLOSED_SESSION: t.List[bool] = []
+
+INJECTOR = NamekoInjector(
+    lambda binder: binder.bind(Session, to=Session, scope=resource_request_scope)
+)
+
+
+def _child():
+    eventlet.sleep(0.01)
+    return INJECTOR.get(WorkerContext).call_id, id(INJECTOR.get(Session))
+
+
+def _slow_child():
+    eventlet.sleep(0.1)
+    USED_CLOSED_SESSION.append(INJECTOR.get(Session).closed)
+
+
+@INJECTOR.decorate_service
+class Service:
+    name = "service"
+
+    @http("GET", "/fan/out")
+    def fan_out(self, request, pool: RequestGreenPool, context: WorkerContext):
+        threads = [pool.spawn(_child) for _ in range(3)]
+        results = [thread.wait() for thread in threads]
+        return json.dumps(
+            {
+                "call_id": context.call_id,
+                "children_call_ids": [call_id for call_id, _ in results],
+                "children_session_ids": [session_id for _, session_id in results],
+            }
+        )
+
+    @http("GET", "/fire/and/forget")
+    def fire_and_forget(self, request, pool: RequestGreenPool, session: Session):
+        pool.spawn_n(_slow_child)
+        return "ok"
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    del SESSIONS[:]
+    del USED_CLOSED_SESSION[:]
+
+
+@pytest.fixture
+def service_class():
+    return Service
+
+
+@pytest.fixture
+def container_overridden_dependencies():
+    # Do not override NamekoInjectorProvider as it prevents calling of worker_* methods
+    # on the provider.
+    return {}
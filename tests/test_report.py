@@ -0,0 +1,203 @@
+"""Test the report of dependency graphs of decorated services."""
+import json
+
+import injector as inj
+import pytest
+from nameko.containers import ServiceContainer
+from nameko.web.handlers import http
+from nameko_injector.core import NamekoInjector, request_scope, resource_request_scope
+from nameko_injector.report import Node, main, report_service
+
+
+def test_closure_with_scopes():
+    report = _report("view_profile")
+    assert {"profile": _name(Profile)} == report.parameters
+    assert [
+        Node(_name(Profile), "request", False, [_name(DBSession), _name(Config)]),
+        Node(_name(DBSession), "resource_request", True, [_name(Config)]),
+        Node(_name(Config), "singleton", False, [_name(ServiceContainer)]),
+        Node(_name(ServiceContainer), "singleton", False, []),
+    ] == report.nodes
+    assert 4 == report.depth
+    assert 2 == report.per_request
+    assert [] == report.findings
+
+
+def test_promotable_request_scoped():
+    findings = _report("view_settings").findings
+    assert [("promotable", _name(Settings))] == [f[:2] for f in findings]
+
+
+def test_unused_closable():
+    findings = _report("view_unused_session").findings
+    assert [("unused_closable", _name(DBSession))] == [f[:2] for f in findings]
+
+
+def test_closables_used_in_one_expression():
+    # CPython 3.13 loads both arguments with a single instruction.
+    assert [] == _report("view_two_sessions").findings
+
+
+def test_deep_graph():
+    report = report_service(Service, max_depth=3)
+    deep = {r.entrypoint for r in report if "deep" in {f.kind for f in r.findings}}
+    assert {"view_profile"} == deep
+
+
+def test_cycle():
+    findings = _report("view_chicken").findings
+    assert ["cycle"] == [f.kind for f in findings]
+
+
+def test_implicit_binding():
+    report = _report("view_clock")
+    assert [Node(_name(Clock), "noscope", False, [])] == report.nodes
+    assert 1 == report.per_request
+    # The report leaves the binder as it is.
+    assert Clock not in INJECTOR.binder._bindings
+
+
+def test_cli_json(capsys):
+    main([f"{__name__}:Service", "--json"])
+    reports = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert ENTRYPOINTS == [report["entrypoint"] for report in reports]
+    assert {"service"} == {report["service"] for report in reports}
+
+
+def test_cli_text(capsys):
+    main([__name__])
+    lines = capsys.readouterr().out.splitlines()
+    assert "service.view_profile depth=4 per_request=2" in lines
+    assert f"    {_name(DBSession)} [resource_request, closable]" in lines
+    assert f"  profile: {_name(Profile)} [request]" in lines
+
+
+def test_cli_unknown_module():
+    with pytest.raises(SystemExit):
+        main(["tests.missing_module"])
+
+
+class Config(dict):
+    pass
+
+
+class DBSession:
+    @inj.inject
+    def __init__(self, config: Config):
+        self.config = config
+
+    def close(self):
+        pass
+
+
+class Profile:
+    @inj.inject
+    def __init__(self, session: DBSession, config: Config):
+        self.session = session
+        self.config = config
+
+
+class OtherSession(DBSession):
+    pass
+
+
+class Settings(dict):
+    pass
+
+
+class Flags:
+    pass
+
+
+class Clock:
+    pass
+
+
+class Chicken:
+    pass
+
+
+class Egg:
+    pass
+
+
+@inj.provider
+def provide_config(container: ServiceContainer) -> Config:
+    return Config(container.config)
+
+
+@inj.provider
+def provide_settings(config: Config, flags: Flags) -> Settings:
+    return Settings(config)
+
+
+@inj.provider
+def provide_chicken(egg: Egg) -> Chicken:
+    return Chicken()
+
+
+@inj.provider
+def provide_egg(chicken: Chicken) -> Egg:
+    return Egg()
+
+
+def configure(binder):
+    binder.bind(Config, to=provide_config, scope=inj.singleton)
+    binder.bind(DBSession, to=DBSession, scope=resource_request_scope)
+    binder.bind(OtherSession, to=OtherSession, scope=resource_request_scope)
+    binder.bind(Profile, to=Profile, scope=request_scope)
+    binder.bind(Settings, to=provide_settings, scope=request_scope)
+    binder.bind(Flags, to=Flags(), scope=request_scope)
+    binder.bind(Chicken, to=provide_chicken)
+    binder.bind(Egg, to=provide_egg)
+
+
+INJECTOR = NamekoInjector(configure)
+
+
+@INJECTOR.decorate_service
+class Service:
+    name = "service"
+
+    @http("GET", "/profile")
+    def view_profile(self, request, profile: Profile):
+        return str(profile)
+
+    @http("GET", "/settings")
+    def view_settings(self, request, settings: Settings):
+        return str(settings)
+
+    @http("GET", "/unused/session")
+    def view_unused_session(self, request, session: DBSession):
+        return "ok"
+
+    @http("GET", "/two/sessions")
+    def view_two_sessions(self, request, first: DBSession, second: OtherSession):
+        return str((first, second))
+
+    @http("GET", "/clock")
+    def view_clock(self, request, clock: Clock):
+        return str(clock)
+
+    @http("GET", "/chicken")
+    def view_chicken(self, request, chicken: Chicken):
+        return "egg"
+
+
+ENTRYPOINTS = [
+    "view_chicken",
+    "view_clock",
+    "view_profile",
+    "view_settings",
+    "view_two_sessions",
+    "view_unused_session",
+]
+
+
+def _report(entrypoint):
+    (report,) = [r for r in report_service(Service) if r.entrypoint == entrypoint]
+    return report
+
+
+def _name(cls):
+    return f"{cls.__module__}.{cls.__qualname__}"
@@ -1,5 +1,6 @@
 import injector
 import json
+import eventlet
 import pytest
 from nameko.web.handlers import http
 from nameko_injector.core import request_scope, NamekoInjector
@@ -72,3 +73,28 @@ def test_same_value_injected_in_http_entrypoint(web_session, web_service):
     assert 200 == response.status_code, str(response.content)
     body = response.json()
     assert body["directly_injected"] == body["second_injection"]
+
+
+class Chicken:
+    @injector.inject
+    def __init__(self, egg: "Egg") -> None:
+        self.egg = egg
+
+
+class Egg:
+    @injector.inject
+    def __init__(self, chicken: Chicken) -> None:
+        self.chicken = chicken
+
+
+def test_circular_dependency_in_request_scope():
+    def configure(binder):
+        binder.bind(Chicken, to=Chicken, scope=request_scope)
+        binder.bind(Egg, to=Egg, scope=request_scope)
+
+    cyclic_injector = NamekoInjector(configure)
+    try:
+        with eventlet.Timeout(1), pytest.raises(injector.CircularDependency):
+            cyclic_injector.get(Chicken)
+    finally:
+        cyclic_injector.get(request_scope.scope).remove_thread_ref()
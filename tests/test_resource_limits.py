@@ -0,0 +1,167 @@
+"""Test number of instances of a resource can be limited across the requests."""
+import json
+import typing as t
+
+import eventlet
+import injector as inj
+import pytest
+from nameko.web.handlers import http
+from nameko_injector.core import (
+    NamekoInjector,
+    ResourceAwareRequestScope,
+    request_scope,
+    resolve_concurrently,
+    resource_request_scope,
+)
+
+# Time the handler holds the connection.
+_DELAY = 0.2
+
+
+def test_request_waits_for_free_slot(web_service, web_session):
+    # When
+    threads = [eventlet.spawn(web_session.get, "/connection") for _ in range(2)]
+    responses = [t.wait() for t in threads]
+    # Then
+    assert {200} == {r.status_code for r in responses}
+    assert 2 == len(CLOSED)
+    stats = SCOPE.limit_stats(Connection)
+    # One of the requests waited for another one to release the slot on teardown.
+    assert stats.wait_time >= _DELAY / 2
+    assert (0, 2, 0) == (stats.in_use, stats.acquired, stats.rejected)
+
+
+def test_stats_under_contention(web_service, web_session):
+    threads = [eventlet.spawn(web_session.get, "/connection") for _ in range(3)]
+    eventlet.sleep(_DELAY / 2)
+    stats = SCOPE.limit_stats(Connection)
+    assert (1, 2) == (stats.in_use, stats.waiting)
+    assert {200} == {t.wait().status_code for t in threads}
+    stats = SCOPE.limit_stats(Connection)
+    assert (0, 0, 3) == (stats.in_use, stats.waiting, stats.acquired)
+
+
+def test_request_rejected_when_no_free_slot(web_service, web_session):
+    # When
+    threads = [eventlet.spawn(web_session.get, "/fast/connection") for _ in range(2)]
+    responses = sorted((t.wait() for t in threads), key=lambda r: r.status_code)
+    # Then
+    assert [200, 500] == [r.status_code for r in responses]
+    assert responses[1].content.startswith(b"Error: ResourceLimitExceededError: ")
+    stats = SCOPE.limit_stats(FastConnection)
+    assert (0, 1, 1) == (stats.in_use, stats.acquired, stats.rejected)
+
+
+def test_branches_of_request_share_limited_instance(web_service, web_session):
+    # Both branches need the connection while the only slot is busy.
+    busy = eventlet.spawn(web_session.get, "/connection")
+    eventlet.sleep(_DELAY / 20)
+    response = web_session.get("/connection/branches")
+    assert 200 == busy.wait().status_code
+    assert 200 == response.status_code, str(response.content)
+    assert 1 == len(set(response.json()))
+    stats = SCOPE.limit_stats(Connection)
+    assert (0, 2, 0) == (stats.in_use, stats.acquired, stats.rejected)
+
+
+def test_slot_released_when_provider_failed():
+    try:
+        with pytest.raises(RuntimeError):
+            INJECTOR.get(BrokenConnection)
+    finally:
+        SCOPE.remove_thread_ref()
+    stats = SCOPE.limit_stats(BrokenConnection)
+    assert (1, 0) == (stats.acquired, stats.in_use)
+
+
+def test_limit_only_resource_request_scope():
+    # request_scope binding and a type that isn't bound
+    for interface in (Reader, int):
+        with pytest.raises(ValueError):
+            INJECTOR.limit_resource(interface, max_instances=1)
+
+
+CLOSED: t.List["Connection"] = []
+
+
+class Connection:
+    def close(self):
+        CLOSED.append(self)
+
+
+class FastConnection(Connection):
+    """Connection that requests do not wait for long."""
+
+
+class BrokenConnection(Connection):
+    """Connection that cannot be established."""
+
+
+class Reader:
+    @inj.inject
+    def __init__(self, connection: Connection):
+        self.connection = connection
+
+
+class Writer(Reader):
+    pass
+
+
+def provide_broken_connection() -> BrokenConnection:
+    raise RuntimeError("Connection refused")
+
+
+def configure(binder):
+    binder.bind(Connection, to=Connection, scope=resource_request_scope)
+    binder.bind(FastConnection, to=FastConnection, scope=resource_request_scope)
+    binder.bind(
+        BrokenConnection, to=provide_broken_connection, scope=resource_request_scope
+    )
+    binder.bind(Reader, to=Reader, scope=request_scope)
+    binder.bind(Writer, to=Writer, scope=request_scope)
+
+
+INJECTOR = NamekoInjector(configure)
+INJECTOR.limit_resource(Connection, max_instances=1, timeout=_DELAY * 10)
+INJECTOR.limit_resource(FastConnection, max_instances=1, timeout=_DELAY / 10)
+INJECTOR.limit_resource(BrokenConnection, max_instances=1)
+SCOPE = INJECTOR.get(ResourceAwareRequestScope)
+
+
+@INJECTOR.decorate_service
+class Service:
+    name = "service"
+
+    @http("GET", "/connection")
+    def view_connection(self, request, connection: Connection):
+        eventlet.sleep(_DELAY)
+        return "ok"
+
+    @resolve_concurrently
+    @http("GET", "/connection/branches")
+    def view_connection_branches(self, request, reader: Reader, writer: Writer):
+        return json.dumps([id(reader.connection), id(writer.connection)])
+
+    @http("GET", "/fast/connection")
+    def view_fast_connection(self, request, connection: FastConnection):
+        eventlet.sleep(_DELAY)
+        return "ok"
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    del CLOSED[:]
+    for interface in (Connection, FastConnection, BrokenConnection):
+        SCOPE.limit(interface, SCOPE._admissions[repr(interface)].limit)
+
+
+@pytest.fixture
+def service_class():
+    return Service
+
+
+@pytest.fixture
+def container_overridden_dependencies():
+    # Do not override NamekoInjectorProvider as it prevents calling of worker_* methods
+    # on the provider.
+    return {}
@@ -0,0 +1,185 @@
+"""Test pooled RPC proxies and event dispatcher injected with AmqpModule."""
+import json
+import typing as t
+
+import pytest
+from nameko.containers import ServiceContainer
+from nameko.web.handlers import http
+from nameko_injector.core import NamekoInjector, ResourceLimitExceededError
+from nameko_injector.rpc import (
+    AmqpModule,
+    EventDispatcher,
+    PooledRpcProxy,
+    RpcProxyPool,
+    is_connected,
+)
+
+
+def test_proxy_reused_between_requests(web_service, web_session):
+    # When
+    responses = [web_session.get(f"/echo/{value}") for value in range(2)]
+    # Then
+    assert {200} == {r.status_code for r in responses}
+    assert [0, 1] == [r.json()["echo"] for r in responses]
+    # The same started proxy served both requests.
+    assert 1 == len({r.json()["proxy_id"] for r in responses})
+    pool = INJECTOR.get(RpcProxyPool)
+    assert "WEB_SERVER_ADDRESS" in pool.config
+
+
+def test_event_dispatched_on_behalf_of_service(web_service, web_session):
+    response = web_session.get("/echo/1")
+    assert 200 == response.status_code, str(response.content)
+    assert [("service", "echoed", {"value": 1})] == DISPATCHED
+
+
+def test_pool_closed_when_service_stopped(runner_factory, web_config, web_session):
+    runner = runner_factory(dict(web_config, MARK=1), Service)
+    runner.start()
+    assert 200 == web_session.get("/echo/1").status_code
+    dispatch = INJECTOR.get(EventDispatcher)
+    runner.stop()
+    (standalone,) = FakeClusterRpcProxy.instances
+    assert standalone.stopped
+    # Service started again gets new singletons built from its own config.
+    runner = runner_factory(dict(web_config, MARK=2), Service)
+    runner.start()
+    assert 200 == web_session.get("/echo/1").status_code
+    assert 2 == INJECTOR.get(ServiceContainer).config["MARK"]
+    assert 2 == INJECTOR.get(RpcProxyPool).config["MARK"]
+    assert INJECTOR.get(EventDispatcher) is not dispatch
+    runner.stop()
+
+
+def test_unhealthy_proxy_replaced():
+    pool = _make_pool()
+    proxy = pool.acquire()
+    proxy.close()
+    # connection to the broker is lost while the proxy is idle
+    FakeClusterRpcProxy.instances[0].connected = False
+
+    pool.acquire().close()
+
+    first, second = FakeClusterRpcProxy.instances
+    assert first.stopped and not second.stopped
+
+
+def test_pool_exhausted():
+    pool = _make_pool(size=1, acquire_timeout=0.01)
+    proxy = pool.acquire()
+    with pytest.raises(ResourceLimitExceededError):
+        pool.acquire()
+    proxy.close()
+    # closing is idempotent and the slot is released once
+    proxy.close()
+    pool.acquire()
+
+
+def test_closed_pool_stops_proxies():
+    pool = _make_pool()
+    idle, in_use = pool.acquire(), pool.acquire()
+    idle.close()
+    pool.close()
+    assert FakeClusterRpcProxy.instances[0].stopped
+    in_use.close()
+    assert FakeClusterRpcProxy.instances[1].stopped
+
+
+def test_standalone_proxy_with_in_memory_broker():
+    pool = RpcProxyPool({"AMQP_URI": "memory://"}, size=1)
+    proxy = pool.acquire()
+    standalone = proxy._standalone
+    assert is_connected(standalone)
+    proxy.close()
+    proxy = pool.acquire()
+    assert proxy._standalone is standalone
+    proxy.close()
+    pool.close()
+    assert not is_connected(standalone)
+
+
+def _make_pool(**kwargs):
+    return RpcProxyPool(
+        {}, proxy_factory=FakeClusterRpcProxy, health_check=_is_healthy, **kwargs
+    )
+
+
+def _is_healthy(standalone: "FakeClusterRpcProxy") -> bool:
+    return standalone.connected
+
+
+class FakeServiceProxy:
+    def echo(self, value):
+        return value
+
+
+class FakeClusterRpcProxy:
+    """Stand-in for nameko ClusterRpcProxy that doesn't need a broker."""
+
+    instances: t.List["FakeClusterRpcProxy"] = []
+
+    def __init__(self, config, timeout=None):
+        self.config = config
+        self.connected = False
+        self.stopped = False
+        self.instances.append(self)
+
+    def start(self):
+        self.connected = True
+        return {"echo_service": FakeServiceProxy()}
+
+    def stop(self):
+        self.connected = False
+        self.stopped = True
+
+
+DISPATCHED: t.List[t.Tuple] = []
+
+
+def fake_event_dispatcher(config):
+    def dispatch(service_name, event_type, event_data):
+        DISPATCHED.append((service_name, event_type, event_data))
+
+    return dispatch
+
+
+INJECTOR = NamekoInjector(
+    AmqpModule(
+        proxy_factory=FakeClusterRpcProxy,
+        health_check=_is_healthy,
+        dispatcher_factory=fake_event_dispatcher,
+    )
+)
+
+
+@INJECTOR.decorate_service
+class Service:
+    name = "service"
+
+    @http("GET", "/echo/<int:value>")
+    def echo(self, request, value, proxy: PooledRpcProxy, dispatch: EventDispatcher):
+        dispatch("echoed", {"value": value})
+        return json.dumps(
+            {
+                "echo": proxy["echo_service"].echo(value),
+                "proxy_id": id(proxy._standalone),
+            }
+        )
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    del FakeClusterRpcProxy.instances[:]
+    del DISPATCHED[:]
+
+
+@pytest.fixture
+def service_class():
+    return Service
+
+
+@pytest.fixture
+def container_overridden_dependencies():
+    # Do not override NamekoInjectorProvider as it prevents calling of worker_* methods
+    # on the provider.
+    return {}
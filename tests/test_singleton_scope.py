@@ -0,0 +1,33 @@
+"""Test singletons are created once and then served without the lock."""
+import eventlet
+import injector as inj
+from nameko_injector.core import LockFreeSingletonScope, NamekoInjector
+
+
+class Engine:
+    created = 0
+
+    def __init__(self):
+        type(self).created += 1
+        # let other green threads ask for the instance while it's being created
+        eventlet.sleep(0.01)
+
+
+def test_singleton_created_once_under_concurrency():
+    Engine.created = 0
+    injector = NamekoInjector(lambda binder: binder.bind(Engine, scope=inj.singleton))
+    threads = [eventlet.spawn(injector.get, Engine) for _ in range(10)]
+    engines = {id(thread.wait()) for thread in threads}
+    assert 1 == len(engines) == Engine.created
+
+
+def test_singleton_scope_replaced_in_nameko_injector():
+    injector = NamekoInjector([])
+    assert isinstance(injector.get(inj.SingletonScope), LockFreeSingletonScope)
+    assert injector.get(inj.SingletonScope) is injector.get(LockFreeSingletonScope)
+
+
+def test_singleton_of_parent_shared_with_child_injector():
+    injector = NamekoInjector(lambda binder: binder.bind(Engine, scope=inj.singleton))
+    child = injector.create_child_injector([])
+    assert child.get(Engine) is injector.get(Engine)
@@ -0,0 +1,136 @@
+"""Test resources stay open until a streamed response is sent."""
+import typing as t
+
+import eventlet
+import pytest
+from nameko.extensions import DependencyProvider
+from nameko.web.handlers import http
+from nameko_injector.core import (
+    NamekoInjector,
+    RequestGreenPool,
+    ResourceAwareRequestScope,
+    resource_request_scope,
+)
+from werkzeug.wrappers import Response
+
+
+def test_cursor_closed_after_response_streamed(web_service, web_session):
+    # When
+    response = web_session.get("/export")
+    # Then
+    assert 200 == response.status_code, str(response.content)
+    # Every row was read from the open cursor.
+    assert b"row-0\nrow-1\nrow-2\n" == response.content
+    cursor = CURSORS[-1]
+    _wait_for(lambda: cursor.closed)
+    assert cursor.closed
+    assert 0 == SCOPE.limit_stats(Cursor).in_use
+
+
+def test_cursor_closed_when_response_sent_before_teardown(web_service, web_session):
+    # Teardown waits for the green thread of the request while the response is sent.
+    response = web_session.get("/export/spawning")
+    assert 200 == response.status_code, str(response.content)
+    assert b"row-0\nrow-1\nrow-2\n" == response.content
+    cursor = CURSORS[-1]
+    _wait_for(lambda: cursor.closed)
+    assert cursor.closed
+    assert 0 == SCOPE.limit_stats(Cursor).in_use
+
+
+def test_cursor_closed_when_result_handling_yields(web_service, web_session):
+    # Another provider does I/O in worker_result while the response is sent.
+    response = web_session.get("/export")
+    assert 200 == response.status_code, str(response.content)
+    cursor = CURSORS[-1]
+    _wait_for(lambda: cursor.closed)
+    assert cursor.closed
+    assert 0 == SCOPE.limit_stats(Cursor).in_use
+    assert RESULTS_TRACED
+
+
+def test_cursor_closed_after_regular_response(web_service, web_session):
+    response = web_session.get("/export/count")
+    assert 200 == response.status_code, str(response.content)
+    assert b"3" == response.content
+    # Closed in the teardown, without waiting for the response to be closed.
+    _wait_for(lambda: CURSORS[-1].closed)
+    assert CURSORS[-1].closed
+
+
+def _wait_for(condition, timeout=1.0):
+    # The response is closed by the server after the last chunk is sent to the client
+    with eventlet.Timeout(timeout, False):
+        while not condition():
+            eventlet.sleep(0.01)
+
+
+class Cursor:
+    def __init__(self):
+        self.closed = False
+        CURSORS.append(self)
+
+    def __iter__(self):
+        for index in range(3):
+            # Streaming from the closed cursor fails the response
+            assert not self.closed
+            eventlet.sleep(0.01)
+            yield f"row-{index}\n"
+
+    def close(self):
+        self.closed = True
+
+
+class ResultTracer(DependencyProvider):
+    def worker_result(self, worker_ctx, result=None, exc_info=None):
+        # sending the trace to the collector takes longer than the response
+        eventlet.sleep(0.1)
+        RESULTS_TRACED.append(worker_ctx.call_id)
+
+
+CURSORS: t.List[Cursor] = []
+RESULTS_TRACED: t.List[str] = []
+
+INJECTOR = NamekoInjector(
+    lambda binder: binder.bind(Cursor, to=Cursor, scope=resource_request_scope)
+)
+INJECTOR.limit_resource(Cursor, max_instances=1)
+SCOPE = INJECTOR.get(ResourceAwareRequestScope)
+
+
+@INJECTOR.decorate_service
+class Service:
+    name = "service"
+
+    tracer = ResultTracer()
+
+    @http("GET", "/export")
+    def export(self, request, cursor: Cursor):
+        return Response(iter(cursor), mimetype="text/plain")
+
+    @http("GET", "/export/spawning")
+    def export_spawning(self, request, cursor: Cursor, pool: RequestGreenPool):
+        pool.spawn_n(eventlet.sleep, 0.2)
+        return Response(iter(cursor), mimetype="text/plain")
+
+    @http("GET", "/export/count")
+    def count(self, request, cursor: Cursor):
+        return str(len(list(cursor)))
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    del CURSORS[:]
+    del RESULTS_TRACED[:]
+
+
+@pytest.fixture
+def service_class():
+    return Service
+
+
+@pytest.fixture
+def container_overridden_dependencies():
+    # Do not override NamekoInjectorProvider as it prevents calling of worker_* methods
+    # on the provider.
+    return {}